@@ -1,8 +1,14 @@
 import os
+import re
+import atexit
+import time
+import uuid
 import psycopg2
 import threading
+from itertools import islice
 from contextlib import contextmanager
 from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.sql import SQL, Identifier
 from fastmcp import FastMCP
 
 # ---------------------------------------------------------
@@ -13,6 +19,14 @@ POOL_LOCK = threading.Lock()
 CONNECTION_POOL: ThreadedConnectionPool | None = None
 
 
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements were PREPAREd on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
 def clean_env(value, default=None):
     if value is None:
         return default
@@ -22,7 +36,7 @@ def clean_env(value, default=None):
 def get_port():
     try:
         return int(clean_env(os.environ.get("DB_PORT"), "5432"))
-    except:
+    except (TypeError, ValueError):
         return 5432
 
 
@@ -37,10 +51,22 @@ def init_pool():
                 port=get_port(),
                 dbname=clean_env(os.environ.get("DB_NAME")),
                 user=clean_env(os.environ.get("DB_USER")),
-                password=clean_env(os.environ.get("DB_PASSWORD"))
+                password=clean_env(os.environ.get("DB_PASSWORD")),
+                connection_factory=PreparingConnection
             )
 
 
+def close_pool():
+    global CONNECTION_POOL
+    with POOL_LOCK:
+        if CONNECTION_POOL is not None:
+            CONNECTION_POOL.closeall()
+            CONNECTION_POOL = None
+
+
+atexit.register(close_pool)
+
+
 def get_conn():
     if CONNECTION_POOL is None:
         init_pool()
@@ -49,9 +75,144 @@ def get_conn():
     return conn
 
 
-def release_conn(conn):
+def release_conn(conn, close=False):
     if CONNECTION_POOL and conn:
-        CONNECTION_POOL.putconn(conn)
+        CONNECTION_POOL.putconn(conn, close=close)
+
+
+@contextmanager
+def db_cursor():
+    """Borrow a pooled connection and yield a cursor; always hands it back."""
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
+        release_conn(conn)
+
+
+@contextmanager
+def stream_cursor(itersize: int = 500):
+    """
+    Yield a server-side cursor that fetches rows in batches of itersize.
+    Named cursors need a transaction, so a READ ONLY one is opened and
+    rolled back. READ ONLY is defence in depth, not the guard: anything
+    after a ";" in the DECLARE string still runs, and a COMMIT there ends
+    the read-only transaction. check_sql() is the guard.
+    """
+    conn = get_conn()
+    conn.autocommit = False
+    conn.readonly = True
+    cur = conn.cursor(name=f"dbx_{uuid.uuid4().hex}")
+    cur.itersize = max(itersize, 1)
+    try:
+        yield cur
+    finally:
+        broken = False
+        try:
+            cur.close()
+            conn.rollback()
+            conn.readonly = None
+        except psycopg2.Error:
+            broken = True
+        finally:
+            release_conn(conn, close=broken or bool(conn.closed))
+
+
+# ---------------------------------------------------------
+# PREPARED STATEMENTS
+# ---------------------------------------------------------
+
+# Hot catalog queries, PREPAREd once per pooled connection so the server
+# skips parse/plan on every call after the first.
+PREPARED_STATEMENTS = {
+    "dbx_list_schemas": """
+        SELECT nspname
+        FROM pg_catalog.pg_namespace
+        WHERE nspname <> 'information_schema'
+          AND nspname !~ '^pg_'
+          AND has_schema_privilege(oid, 'USAGE')
+        ORDER BY nspname
+    """,
+    "dbx_list_tables": """
+        SELECT c.relname
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = $1
+          AND c.relkind IN ('r', 'p', 'v', 'f')
+          AND has_schema_privilege(n.oid, 'USAGE')
+          AND has_any_column_privilege(c.oid, 'SELECT')
+        ORDER BY c.relname
+    """,
+    "dbx_describe_table": """
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_catalog.pg_attribute a
+        JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = $1 AND c.relname = $2
+          AND c.relkind IN ('r', 'p', 'v', 'f')
+          AND has_schema_privilege(n.oid, 'USAGE')
+          AND has_column_privilege(c.oid, a.attnum, 'SELECT')
+          AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """,
+}
+
+
+def execute_prepared(cur, name, params=()):
+    """EXECUTE a statement from PREPARED_STATEMENTS, preparing it first if needed."""
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        conn.prepared.add(name)
+
+    if params:
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+# ---------------------------------------------------------
+# METADATA CACHE
+# ---------------------------------------------------------
+
+CACHE_LOCK = threading.Lock()
+METADATA_CACHE: dict = {}
+CACHE_MAX_ENTRIES = 1024
+
+
+def get_cache_ttl():
+    try:
+        return float(clean_env(os.environ.get("CACHE_TTL_SECONDS"), "300"))
+    except ValueError:
+        return 300.0
+
+
+CACHE_TTL = get_cache_ttl()
+
+
+def cache_get(key):
+    """
+    Return the cached value for key, or None if missing or expired.
+    Lock-free: entries are immutable tuples and dict.get is atomic, so
+    CACHE_LOCK only serialises writers.
+    """
+    entry = METADATA_CACHE.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def cache_put(key, value):
+    """Store value under key, evicting the oldest write once the cache is full."""
+    with CACHE_LOCK:
+        METADATA_CACHE.pop(key, None)
+        while len(METADATA_CACHE) >= CACHE_MAX_ENTRIES:
+            METADATA_CACHE.pop(next(iter(METADATA_CACHE)))
+        METADATA_CACHE[key] = (time.monotonic() + CACHE_TTL, value)
+    return value
 
 
 # ---------------------------------------------------------
@@ -68,20 +229,15 @@ mcp = FastMCP("db-explorer")
 @mcp.tool()
 def list_schemas() -> dict:
     """Return all non-system schemas."""
-    conn = get_conn()
-    cur = conn.cursor()
+    cached = cache_get(("list_schemas",))
+    if cached is not None:
+        return cached
 
-    cur.execute("""
-        SELECT schema_name
-        FROM information_schema.schemata
-        WHERE schema_name NOT IN ('information_schema', 'pg_catalog')
-        ORDER BY schema_name;
-    """)
+    with db_cursor() as cur:
+        execute_prepared(cur, "dbx_list_schemas")
+        schemas = [row[0] for row in cur.fetchall()]
 
-    schemas = [row[0] for row in cur.fetchall()]
-    cur.close()
-    release_conn(conn)
-    return {"schemas": schemas}
+    return cache_put(("list_schemas",), {"schemas": schemas})
 
 
 # ---------------------------------------------------------
@@ -91,20 +247,15 @@ def list_schemas() -> dict:
 @mcp.tool()
 def list_tables(schema: str) -> dict:
     """Return all tables inside a given schema."""
-    conn = get_conn()
-    cur = conn.cursor()
+    cached = cache_get(("list_tables", schema))
+    if cached is not None:
+        return cached
 
-    cur.execute("""
-        SELECT table_name
-        FROM information_schema.tables
-        WHERE table_schema = %s
-        ORDER BY table_name;
-    """, (schema,))
+    with db_cursor() as cur:
+        execute_prepared(cur, "dbx_list_tables", (schema,))
+        tables = [row[0] for row in cur.fetchall()]
 
-    tables = [row[0] for row in cur.fetchall()]
-    cur.close()
-    release_conn(conn)
-    return {"schema": schema, "tables": tables}
+    return cache_put(("list_tables", schema), {"schema": schema, "tables": tables})
 
 
 # ---------------------------------------------------------
@@ -114,48 +265,72 @@ def list_tables(schema: str) -> dict:
 @mcp.tool()
 def describe_table(schema: str, table: str) -> dict:
     """Return column names + datatypes for a table."""
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT column_name, data_type
-        FROM information_schema.columns
-        WHERE table_schema = %s AND table_name = %s
-        ORDER BY ordinal_position;
-    """, (schema, table))
+    cached = cache_get(("describe_table", schema, table))
+    if cached is not None:
+        return cached
 
-    rows = cur.fetchall()
-    cur.close()
-    release_conn(conn)
+    with db_cursor() as cur:
+        execute_prepared(cur, "dbx_describe_table", (schema, table))
+        rows = cur.fetchall()
 
     if not rows:
         return {"error": f"Table '{schema}.{table}' not found"}
 
     columns = [{"name": r[0], "data_type": r[1]} for r in rows]
-    return {"schema": schema, "table": table, "columns": columns}
+    return cache_put(
+        ("describe_table", schema, table),
+        {"schema": schema, "table": table, "columns": columns}
+    )
+
+
+# ---------------------------------------------------------
+# TOOL: refresh_schema()
+# ---------------------------------------------------------
+
+@mcp.tool()
+def refresh_schema() -> dict:
+    """Drop cached schema/table/column metadata so the next calls re-read it."""
+    with CACHE_LOCK:
+        cleared = len(METADATA_CACHE)
+        METADATA_CACHE.clear()
+    return {"cleared": cleared}
 
 
 # ---------------------------------------------------------
 # TOOL: preview_rows(schema, table, limit)
 # ---------------------------------------------------------
 
+# Row cap shared by preview_rows and run_query_safe.
+MAX_QUERY_ROWS = 200
+PREVIEW_SQL = SQL("SELECT * FROM {}.{} LIMIT %s;")
+
+
 @mcp.tool()
 def preview_rows(schema: str, table: str, limit: int = 20) -> dict:
-    """Return first N rows of a table."""
-    conn = get_conn()
-    cur = conn.cursor()
+    """
+    Return first N rows of a table (1 to MAX_QUERY_ROWS).
+    truncated is set when the cap cut off rows the caller asked for.
+    """
+    capped = limit > MAX_QUERY_ROWS
+    limit = max(1, min(limit, MAX_QUERY_ROWS))
+    # Read one extra row when capped, to tell whether the cap cut anything.
+    fetch = limit + 1 if capped else limit
 
     try:
-        cur.execute(f"SELECT * FROM {schema}.{table} LIMIT %s;", (limit,))
-        cols = [d[0] for d in cur.description]
-        rows = cur.fetchall()
-
-        cur.close()
-        release_conn(conn)
-        return {"schema": schema, "table": table, "columns": cols, "rows": rows}
-    except Exception as e:
-        cur.close()
-        release_conn(conn)
+        with stream_cursor(itersize=fetch) as cur:
+            cur.execute(PREVIEW_SQL.format(Identifier(schema), Identifier(table)), (fetch,))
+            rows = list(islice(cur, fetch))
+            cols = [d[0] for d in cur.description]
+
+        return {
+            "schema": schema,
+            "table": table,
+            "columns": cols,
+            "rows": rows[:limit],
+            "limit": limit,
+            "truncated": len(rows) > limit
+        }
+    except psycopg2.Error as e:
         return {"error": str(e)}
 
 
@@ -164,6 +339,57 @@ def preview_rows(schema: str, table: str, limit: int = 20) -> dict:
 # ---------------------------------------------------------
 
 FORBIDDEN = ["insert", "update", "delete", "drop", "alter", "create", "truncate"]
+FORBIDDEN_RE = re.compile(r"\b(" + "|".join(FORBIDDEN) + r")\b", re.I)
+
+# Tokens that can hide or fake a keyword, matched the way PostgreSQL's lexer
+# (scan.l) reads them. Identifiers are matched (and kept) so a "$" inside one,
+# as in a$b$, is never mistaken for the start of a dollar-quote. Like PG,
+# every non-ASCII character counts as an identifier character.
+IDENT_START = r"[A-Za-z_\x80-\U0010ffff]"
+IDENT_CONT = r"[A-Za-z_0-9\x80-\U0010ffff]"
+
+SQL_NOISE = re.compile(rf"""
+      [Ee]'(?:[^'\\]|\\.|'')*'                                     # E'escape string', backslash escapes
+    | (?P<ident>{IDENT_START}(?:{IDENT_CONT}|\$)*)                 # identifier or keyword, kept as is
+    | '(?:[^']|'')*'                                               # 'string literal'
+    | "(?:[^"]|"")*"                                               # "quoted identifier"
+    | \$(?P<tag>(?:{IDENT_START}{IDENT_CONT}*)?)\$.*?\$(?P=tag)\$  # $tag$ dollar-quoted body $tag$
+    | --[^\n\r]*                                                   # -- line comment, ends at \n or \r
+    | /\*(?:(?!/\*).)*?\*/                                         # /* block comment */ without nesting
+""", re.S | re.X)
+
+
+def strip_sql_noise(sql: str) -> str:
+    """Blank out string literals, quoted identifiers and comments."""
+    return SQL_NOISE.sub(lambda m: m.group("ident") or " ", sql)
+
+
+def check_sql(sql: str) -> str | None:
+    """Return why run_query_safe must refuse sql, or None if it may run."""
+    cleaned = strip_sql_noise(sql).strip().rstrip(";").strip()
+
+    # Whatever is left unmatched is an unterminated literal or identifier;
+    # refuse rather than guess where PostgreSQL would end it.
+    if "'" in cleaned or '"' in cleaned:
+        return "Unterminated quoted string"
+
+    # PG block comments nest; a "/*" left over is a nested or unterminated
+    # comment whose end we can't be sure of, so refuse it too.
+    if "/*" in cleaned:
+        return "Nested or unterminated comment"
+
+    if ";" in cleaned:
+        return "Only a single statement is permitted"
+
+    # Block write operations
+    match = FORBIDDEN_RE.search(cleaned)
+    if match:
+        return f"Operation '{match.group(1).lower()}' is not allowed"
+
+    if cleaned[:6].lower() != "select":
+        return "Only SELECT queries are permitted"
+
+    return None
 
 
 @mcp.tool()
@@ -171,32 +397,22 @@ def run_query_safe(sql: str) -> dict:
     """
     Execute SELECT queries (joins allowed). 
     Blocks modification queries for safety.
+    Returns at most MAX_QUERY_ROWS rows.
     """
-    cleaned = sql.lower().strip()
-
-    # Block write operations
-    for word in FORBIDDEN:
-        if cleaned.startswith(word) or f" {word} " in cleaned:
-            return {"error": f"Operation '{word}' is not allowed"}
-
-    if not cleaned.startswith("select"):
-        return {"error": "Only SELECT queries are permitted"}
-
-    conn = get_conn()
-    cur = conn.cursor()
+    error = check_sql(sql)
+    if error:
+        return {"error": error}
 
     try:
-        cur.execute(sql)
-        cols = [d[0] for d in cur.description]
-        rows = cur.fetchall()
+        with stream_cursor(itersize=MAX_QUERY_ROWS + 1) as cur:
+            cur.execute(sql)
+            rows = list(islice(cur, MAX_QUERY_ROWS + 1))
+            cols = [d[0] for d in cur.description]
 
-        cur.close()
-        release_conn(conn)
-        return {"columns": cols, "rows": rows}
+        truncated = len(rows) > MAX_QUERY_ROWS
+        return {"columns": cols, "rows": rows[:MAX_QUERY_ROWS], "truncated": truncated}
 
-    except Exception as e:
-        cur.close()
-        release_conn(conn)
+    except psycopg2.Error as e:
         return {"error": str(e)}
 
 
@@ -0,0 +1,109 @@
+import unittest
+from unittest import mock
+
+import server
+from server import check_sql, strip_sql_noise
+
+
+class CheckSqlTests(unittest.TestCase):
+
+    def test_plain_select_is_allowed(self):
+        self.assertIsNone(check_sql("select id, name from sales.orders where id < 4"))
+        self.assertIsNone(check_sql("SELECT 1;"))
+
+    def test_keywords_inside_literals_are_allowed(self):
+        self.assertIsNone(check_sql("select 'please delete me' as msg"))
+        self.assertIsNone(check_sql("select $$ drop $$, $q$x;y$q$ as s"))
+        self.assertIsNone(check_sql("select 1 -- drop table t"))
+        self.assertIsNone(check_sql('select "delete" from t'))
+
+    def test_keywords_as_part_of_names_are_allowed(self):
+        self.assertIsNone(check_sql("select updated_at, inserted_at from t"))
+
+    def test_write_statements_are_blocked(self):
+        self.assertEqual(check_sql("delete from t"), "Operation 'delete' is not allowed")
+        self.assertEqual(check_sql("SELECT 1 FROM t WHERE x = 1\n\tDELETE"), "Operation 'delete' is not allowed")
+
+    def test_multiple_statements_are_blocked(self):
+        self.assertEqual(check_sql("select 1;delete from t"), "Only a single statement is permitted")
+
+    def test_escape_string_cannot_hide_statements(self):
+        sql = "SELECT E'\\''; COMMIT; DROP TABLE t; --'"
+        self.assertEqual(strip_sql_noise(sql).split()[0], "SELECT")
+        self.assertIn("DROP", strip_sql_noise(sql))
+        self.assertIsNotNone(check_sql(sql))
+
+    def test_dollar_inside_identifier_is_not_a_dollar_quote(self):
+        sql = "SELECT 1 AS a$b$; COMMIT; DROP TABLE t; SELECT 1 AS c$b$"
+        self.assertIn("DROP", strip_sql_noise(sql))
+        self.assertIsNotNone(check_sql(sql))
+
+    def test_dollar_quote_tag_cannot_start_with_digit(self):
+        self.assertIsNotNone(check_sql("SELECT $1$; DROP TABLE t; $1$"))
+
+    def test_carriage_return_ends_line_comment(self):
+        sql = "SELECT 1 --\r; COMMIT; DROP TABLE t; SELECT 1"
+        self.assertIn("DROP", strip_sql_noise(sql))
+        self.assertIsNotNone(check_sql(sql))
+
+    def test_nested_block_comment_is_blocked(self):
+        sql = "SELECT 1 /* /* */ 'x */; COMMIT; DROP TABLE t; SELECT 1 --'"
+        self.assertIsNotNone(check_sql(sql))
+        self.assertEqual(check_sql("select 1 /* a /* b */ c */"), "Nested or unterminated comment")
+
+    def test_non_ascii_identifier_is_not_followed_by_a_dollar_quote(self):
+        sql = "SELECT 1 AS x\u2026$q$; COMMIT; DROP TABLE t; SELECT 1 AS y\u2026$q$"
+        self.assertIn("DROP", strip_sql_noise(sql))
+        self.assertIsNotNone(check_sql(sql))
+        self.assertIsNotNone(check_sql("SELECT 1 AS \u0663$q$; DROP TABLE t; SELECT 1 AS \u0663$q$"))
+
+    def test_non_ascii_identifiers_are_allowed(self):
+        self.assertIsNone(check_sql("select caf\u00e9 from t /* note */"))
+
+    def test_unterminated_literal_is_blocked(self):
+        self.assertEqual(check_sql("select 'abc; drop table t"), "Unterminated quoted string")
+
+
+class MetadataCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        server.METADATA_CACHE.clear()
+        self.addCleanup(server.METADATA_CACHE.clear)
+
+    def test_entry_expires_after_ttl(self):
+        with mock.patch.object(server, "CACHE_TTL", 60), \
+                mock.patch.object(server.time, "monotonic", return_value=1000.0) as now:
+            server.cache_put(("list_schemas",), {"schemas": ["sales"]})
+            now.return_value = 1060.0
+            self.assertEqual(server.cache_get(("list_schemas",)), {"schemas": ["sales"]})
+            now.return_value = 1060.5
+            self.assertIsNone(server.cache_get(("list_schemas",)))
+
+    def test_cache_never_exceeds_max_entries(self):
+        with mock.patch.object(server, "CACHE_MAX_ENTRIES", 3):
+            for i in range(10):
+                server.cache_put(("list_tables", f"s{i}"), i)
+                self.assertLessEqual(len(server.METADATA_CACHE), 3)
+        self.assertEqual(
+            list(server.METADATA_CACHE),
+            [("list_tables", "s7"), ("list_tables", "s8"), ("list_tables", "s9")]
+        )
+
+    def test_rewriting_a_key_moves_it_to_the_back(self):
+        with mock.patch.object(server, "CACHE_MAX_ENTRIES", 3):
+            for key in ("a", "b", "c"):
+                server.cache_put((key,), key)
+            server.cache_put(("a",), "a2")
+            server.cache_put(("d",), "d")
+        self.assertEqual(list(server.METADATA_CACHE), [("c",), ("a",), ("d",)])
+        self.assertEqual(server.cache_get(("a",)), "a2")
+
+    def test_refresh_schema_empties_the_cache(self):
+        server.cache_put(("list_schemas",), {"schemas": []})
+        server.cache_put(("list_tables", "sales"), {"tables": []})
+        self.assertEqual(server.refresh_schema(), {"cleared": 2})
+        self.assertEqual(server.METADATA_CACHE, {})
+
+
+if __name__ == "__main__":
+    unittest.main()